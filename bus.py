@@ -0,0 +1,59 @@
+# bus.py
+"""
+Очередь к шине RS-485.
+Порт один и полудуплексный, поэтому все обращения к колонкам выполняются
+строго по одному, в порядке поступления, одним воркером. Сам обмен идёт
+в отдельном потоке, event loop FastAPI при этом не блокируется.
+"""
+import asyncio
+import contextlib
+from typing import Any, Callable, Optional
+
+_queue: Optional[asyncio.Queue] = None
+_worker: Optional[asyncio.Task] = None
+
+
+async def _bus_worker() -> None:
+    while True:
+        fut, fn = await _queue.get()
+        try:
+            if fut.done():
+                # вызывающий уже не ждёт (отменён) — шину не занимаем
+                continue
+            result = await asyncio.to_thread(fn)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+        else:
+            if not fut.done():
+                fut.set_result(result)
+        finally:
+            _queue.task_done()
+
+
+def start() -> None:
+    """Запускает воркер шины (из startup-события FastAPI)."""
+    global _queue, _worker
+    _queue = asyncio.Queue()
+    _worker = asyncio.create_task(_bus_worker())
+
+
+async def stop() -> None:
+    """Останавливает воркер шины (из shutdown-события FastAPI)."""
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _worker
+        _worker = None
+
+
+async def submit(fn: Callable[[], Any]) -> Any:
+    """
+    Ставит fn (синхронный вызов pump_service) в очередь шины и ждёт результат.
+    Исключение, брошенное fn, пробрасывается вызывающему.
+    Если вызывающего отменили, пока fn ждала в очереди, fn не выполняется.
+    """
+    fut = asyncio.get_running_loop().create_future()
+    await _queue.put((fut, fn))
+    return await fut
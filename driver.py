@@ -1,8 +1,13 @@
 import serial
 import logging
+import select
+import struct
+import time
 from utils import calc_crc, bcd_pack, bcd_unpack
 import settings
 
+logger = logging.getLogger(__name__)
+
 # MKR5 DART-уровень-3 коды команд (DCC)
 RETURN_STATUS        = 0x00
 RETURN_PUMP_PARAMS   = 0x02
@@ -13,6 +18,99 @@ RETURN_PUMP_IDENTITY = 0x03
 CD1 = 0x01  # команда
 # ...
 
+# Заголовок блока с одной CD1 (addr, ctrl, CD1, длина, DCC) и хвост (CRC, ETX, SF)
+_HDR     = struct.Struct("<BBBBB")
+_TRAILER = struct.Struct("<HBB")
+
+# Максимальная длина принимаемого блока (защита от «бесконечного» ответа)
+MAX_FRAME = 256
+
+# DC7: бит0 каждого из 8 байт и множитель, переносящий бит0 байта i в бит 56+i
+_BYTE_LSB    = 0x0101010101010101
+_GATHER_BITS = 0x0102040810204080
+
+# DC1: код состояния колонки -> имя (None — кода нет в протоколе)
+_STATUS = (
+    "NOT_PROGRAMMED", "RESET", "AUTHORIZED", None,
+    "FILLING", "FILLING_COMPLETE", "MAX_REACHED", "SWITCHED_OFF",
+)
+
+
+# Разбор DC-транзакций ответа: data — словарь результата, content — данные транзакции
+def _parse_dc1(data: dict, content) -> None:
+    # DC1: статус
+    st = content[0]
+    name = _STATUS[st] if st < len(_STATUS) else None
+    data["pump_status"] = name or f"UNKNOWN({st})"
+
+
+def _parse_dc2(data: dict, content) -> None:
+    # DC2: vol+amt
+    data["current_volume"] = bcd_unpack(content[0:4], decimals=settings.VOL_DECIMALS)
+    data["current_amount"] = bcd_unpack(content[4:8], decimals=settings.AMT_DECIMALS)
+
+
+def _parse_dc3(data: dict, content) -> None:
+    # DC3: nozzle+price
+    price = bcd_unpack(content[0:3], decimals=settings.PRICE_DECIMALS)
+    noz   = content[3] & 0x0F
+    outf  = bool((content[3] & 0x10) >> 4)
+    data["current_nozzle"] = noz or None
+    data["nozzle_out"] = outf
+    data["current_price"] = price
+
+
+def _parse_dc7(data: dict, content) -> None:
+    # DC7: pump parameters (16-ый транзакций — DART full impl.)
+    # content: [..., GRADE1, GRADE2, ...] – здесь один бит = существование града
+    # допустим, каждый байт LSB бит0 = 1 → есть nozzle №(idx+1)
+    # смещение: первые 1(reserved22)+1+1+1+5 +4+2 = 36 байт, потом 15 байт grades
+    # для простоты: берем последние 15 байт
+    grade_bytes = content[-15:]
+    # без цикла: сворачиваем каждый байт в его бит0 (байт != 0 → 1),
+    # затем собираем бит0 всех байт в маску умножением (по 8 байт)
+    f = int.from_bytes(grade_bytes, "little")
+    f |= f >> 4
+    f |= f >> 2
+    f |= f >> 1
+    data["grades_mask"] = ((((f & _BYTE_LSB) * _GATHER_BITS) >> 56) & 0xFF
+                           | ((((f >> 64) & _BYTE_LSB) * _GATHER_BITS) >> 56 & 0xFF) << 8)
+
+
+def _parse_dc9(data: dict, content) -> None:
+    # DC9: identity, 5-байт BCD
+    data["pump_identity"] = content.hex().upper()
+
+
+_HANDLERS = {
+    0x01: _parse_dc1,
+    0x02: _parse_dc2,
+    0x03: _parse_dc3,
+    0x07: _parse_dc7,
+    0x09: _parse_dc9,
+}
+
+
+def _build_frames(dcc: int) -> tuple:
+    """
+    Готовые DART-блоки CD1 без payload для всех адресов и номеров блока:
+    _build_frames(dcc)[pump_id][txn] -> bytes (txn 1..15, индекс 0 не используется).
+    """
+    frames = []
+    for pump_id in range(32):
+        row = [b""]
+        for txn in range(1, 16):
+            block = bytes((0x50 + pump_id, 0x80 | ((txn & 0x0F) << 4), CD1, 1, dcc))
+            crc = calc_crc(block)
+            row.append(block + bytes((crc & 0xFF, (crc >> 8) & 0xFF, 0x03, 0xFA)))
+        frames.append(tuple(row))
+    return tuple(frames)
+
+
+# Опросы без данных (list_pumps, list_nozzles, статус) кадрируются один раз при импорте
+_FRAMES = {dcc: _build_frames(dcc) for dcc in (RETURN_STATUS, RETURN_PUMP_PARAMS, RETURN_PUMP_IDENTITY)}
+
+
 class MKR5Driver:
     def __init__(self, port: str, baudrate: int = settings.BAUDRATE, timeout: float = settings.TIMEOUT):
         self.port_name = port
@@ -20,6 +118,8 @@ class MKR5Driver:
         self.timeout   = timeout
         self.ser       = None
         self._tx_number = 0
+        self._txbuf    = bytearray(64)  # буфер сборки исходящего блока
+        self._rx_buf   = bytearray()   # недочитанный хвост для poll_responses
 
     def open(self):
         self.ser = serial.Serial(self.port_name,
@@ -28,53 +128,201 @@ class MKR5Driver:
                                  parity=serial.PARITY_ODD,
                                  stopbits=1,
                                  timeout=self.timeout)
-        logging.info(f"Opened serial port {self.port_name}")
+        logger.info("Opened serial port %s", self.port_name)
 
     def close(self):
         if self.ser and self.ser.is_open:
             self.ser.close()
-            logging.info("Serial port closed")
+            logger.info("Serial port closed")
 
     def _next_tx(self) -> int:
         # счётчик блока (1–15)
         self._tx_number = (self._tx_number % 0x0F) + 1
         return self._tx_number
 
+    def _build_packet(self, pump_id: int, dcc: int):
+        """
+        Собирает DART-блок с одной транзакцией CD1 (addr, ctrl, CD1, DCC, CRC, ETX, SF).
+        Для частых опросов берётся готовый кадр из _FRAMES, иначе блок
+        собирается прямо в self._txbuf и возвращается memoryview на него —
+        он валиден до следующей сборки.
+        """
+        txn = self._next_tx()
+        frames = _FRAMES.get(dcc)
+        if frames is not None and 0 <= pump_id < 32:
+            return frames[pump_id][txn]
+
+        buf = self._txbuf
+        # addr, __CTRL__ (бит7=1 master→slave, биты6-4 = txn, биты3-0=0),
+        # уровень-3: CD1, длина, DCC
+        _HDR.pack_into(buf, 0, 0x50 + pump_id, 0x80 | ((txn & 0x0F) << 4), CD1, 1, dcc)
+        n = _HDR.size
+
+        # CRC уровня-2 (младший байт первым), ETX=0x03, SF=0xFA
+        mv = memoryview(buf)
+        _TRAILER.pack_into(buf, n, calc_crc(mv[:n]), 0x03, 0xFA)
+        return mv[:n + _TRAILER.size]
+
+    def _build_block(self, pump_id: int, parts) -> memoryview:
+        """
+        Собирает в self._txbuf DART-блок из готовых транзакций уровня-3:
+        части `parts` пишутся подряд, без склейки в промежуточный bytes.
+        """
+        txn = self._next_tx()
+        n = 2 + sum(len(p) for p in parts)
+        if n + _TRAILER.size > len(self._txbuf):
+            self._txbuf = bytearray(n + _TRAILER.size)
+        buf = self._txbuf
+        buf[0] = 0x50 + pump_id
+        # __CTRL__: бит7=1 (master→slave), биты6-4 = txn, биты3-0=0
+        buf[1] = 0x80 | ((txn & 0x0F) << 4)
+        off = 2
+        for p in parts:
+            buf[off:off + len(p)] = p
+            off += len(p)
+
+        mv = memoryview(buf)
+        _TRAILER.pack_into(buf, n, calc_crc(mv[:n]), 0x03, 0xFA)
+        return mv[:n + _TRAILER.size]
+
+    def _exchange(self, pump_id: int, packet) -> memoryview:
+        """
+        Сбрасывает входной буфер, отправляет готовый блок и ждёт один ответный.
+        Возвращает memoryview на ответ (см. _read_block) — без копии в bytes.
+        """
+        if not self.ser or not self.ser.is_open:
+            raise RuntimeError("Serial port is not open")
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("→ [%d] %s", pump_id, packet.hex())
+        self.ser.reset_input_buffer()
+        self._rx_buf.clear()
+        self.ser.write(packet)
+
+        resp = self._read_block()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("← [%d] %s", pump_id, resp.hex())
+        return resp
+
     def send_command(self, pump_id: int, dcc: int, payload: bytes = b"") -> bytes:
         """
         Формирует и отправляет DART-блок с одной транзакцией CD1.
         pump_id: 0..31 => физический адрес = 0x50+ pump_id
         dcc: код команды из DCC (например, RETURN_STATUS)
         payload: дополнительные байты, если нужно
+        Возвращает сырой ответный блок; разобранный — см. exchange().
         """
-        if not self.ser or not self.ser.is_open:
-            raise RuntimeError("Serial port is not open")
+        return bytes(self._exchange(pump_id, self._build_packet(pump_id, dcc)))
 
-        addr = 0x50 + pump_id
-        txn = self._next_tx()
-        # __CTRL__: бит7=1 (master→slave), биты6-4 = txn, биты3-0=0
-        ctrl = 0x80 | ((txn & 0x0F) << 4)
+    def send_transactions(self, pump_id: int, parts) -> bytes:
+        """
+        Отправляет DART-блок с произвольными транзакциями уровня-3
+        (CD2 + CD3 + CD1 и т.п.) и возвращает сырой ответный блок;
+        разобранный — см. exchange_chain().
+        parts: куски уровня-3 (заголовки транзакций, данные), пишутся подряд.
+        """
+        return bytes(self._exchange(pump_id, self._build_block(pump_id, parts)))
 
-        # формируем уровень-3: CD1,DCC
-        data3 = bytes([CD1, 1]) + bytes([dcc])
-        # если payload есть — его инъектим внутрь (хотя для CD1 у нас payload==b"")
-        block = bytes([addr, ctrl]) + data3
+    def exchange(self, pump_id: int, dcc: int) -> dict:
+        """
+        send_command + parse_response за один вызов: ответный блок разбирается
+        прямо в буфере приёма (memoryview), без копии в промежуточный bytes.
+        """
+        return self.parse_response(self._exchange(pump_id, self._build_packet(pump_id, dcc)))
 
-        # считаем CRC уровня-2
-        crc = calc_crc(block)
-        crc_bytes = bytes([crc & 0xFF, (crc >> 8) & 0xFF])
+    def exchange_chain(self, pump_id: int, parts) -> dict:
+        """
+        Цепочка транзакций уровня-3 (напр. CD2 → CD3 → CD1 AUTHORIZE) одним
+        DART-блоком, т.е. одним write: колонка выполняет их по порядку.
+        send_transactions + parse_response, ответ разбирается на месте, как в exchange().
+        parts: куски уровня-3 (заголовки транзакций, данные), пишутся подряд.
+        """
+        return self.parse_response(self._exchange(pump_id, self._build_block(pump_id, parts)))
 
-        # ETX=0x03, SF=0xFA
-        packet = block + crc_bytes + b"\x03\xFA"
+    def _read_block(self) -> memoryview:
+        """
+        Читает один блок до ETX+SF (0x03 0xFA). Ждём данные через select,
+        затем забираем одним read всё, что уже лежит в буфере порта (in_waiting),
+        вместо побайтового read_until.
+        Возвращает memoryview на блок в свежем bytearray (буфер не переиспользуется,
+        поэтому view можно держать сколько угодно).
+        TimeoutError — если блок не пришёл целиком за self.timeout.
+        """
+        buf = bytearray()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            r, _, _ = select.select([self.ser.fd], [], [], max(remaining, 0))
+            if not r:
+                raise TimeoutError(f"No response within {self.timeout}s (got {buf.hex() or 'nothing'})")
+            buf += self.ser.read(self.ser.in_waiting or 1)
+            end = buf.find(b"\x03\xFA")
+            if end >= 0:
+                return memoryview(buf)[:end + 2]
+            if len(buf) > MAX_FRAME:
+                raise RuntimeError(f"Response exceeds {MAX_FRAME} bytes without ETX/SF")
 
-        logging.debug(f"→ [{pump_id}] " + packet.hex())
-        self.ser.reset_input_buffer()
+    def send_command_nowait(self, pump_id: int, dcc: int) -> None:
+        """
+        Отправляет DART-блок CD1 и не ждёт ответа.
+        Ответы забираются потом через poll_responses() — так можно
+        опрашивать несколько адресов, не простаивая timeout на каждом.
+        Следующий опрос шлётся только после возврата poll_responses():
+        линия полудуплексная, начатый ответ к тому времени уже дочитан.
+        """
+        if not self.ser or not self.ser.is_open:
+            raise RuntimeError("Serial port is not open")
+
+        packet = self._build_packet(pump_id, dcc)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("→ [%d] %s", pump_id, packet.hex())
         self.ser.write(packet)
 
-        # читаем до стоп-флага 0xFA
-        resp = self.ser.read_until(expected=b"\xFA")
-        logging.debug(f"← [{pump_id}] " + resp.hex())
-        return resp
+    def poll_responses(self, timeout: float) -> list:
+        """
+        Ждёт ответные DART-блоки (select по fd порта) и возвращает их списком bytes.
+        Блоки режутся по ETX+SF (0x03 0xFA).
+        `timeout` — сколько ждать начала ответа. Возврат — сразу, как только
+        пришёл целый блок, за ним нет недочитанного хвоста и новые байты
+        не идут: после этого линию можно занимать следующим опросом.
+        Начатый блок дочитывается, пока байты идут (пауза между ними меньше
+        self.timeout); хвост, оборвавшийся дольше, отбрасывается — в буфере
+        между вызовами неполных блоков не остаётся.
+        Линия, которая не замолкает (шум, «болтливый» slave), не держит вызов
+        дольше timeout + self.timeout; RuntimeError — как в _read_block, если
+        накопилось больше MAX_FRAME байт без ETX/SF.
+        """
+        frames = []
+        buf = self._rx_buf
+        deadline = last_rx = time.monotonic()
+        deadline += timeout
+        hard_deadline = deadline + self.timeout
+        while not frames or buf or self.ser.in_waiting:
+            # пока блок не допришёл, линия занята — ждём его хвост
+            until = max(deadline, last_rx + self.timeout) if buf else deadline
+            remaining = min(until, hard_deadline) - time.monotonic()
+            if remaining <= 0:
+                break
+            r, _, _ = select.select([self.ser.fd], [], [], remaining)
+            if not r:
+                break
+            buf += self.ser.read(self.ser.in_waiting or 1)
+            last_rx = time.monotonic()
+            end = buf.find(b"\x03\xFA")
+            while end >= 0:
+                frame = bytes(buf[:end + 2])
+                del buf[:end + 2]
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("← %s", frame.hex())
+                frames.append(frame)
+                end = buf.find(b"\x03\xFA")
+            if len(buf) > MAX_FRAME:
+                buf.clear()
+                raise RuntimeError(f"Response exceeds {MAX_FRAME} bytes without ETX/SF")
+        if buf:
+            logger.warning("Dropping incomplete frame %s", buf.hex())
+            buf.clear()
+        return frames
 
     def parse_response(self, resp: bytes) -> dict:
         """
@@ -87,60 +335,27 @@ class MKR5Driver:
           - grades_mask (int)  ← из DC7
         """
         data = {}
+        # срезы memoryview — без копий ответа
+        mv = memoryview(resp)
         # отбрасываем addr,ctrl
-        core = resp[2:-2]   # до CRC и ETX/SF
+        core = mv[2:-2]   # до CRC и ETX/SF
         # проверяем CRC
         recv_crc = core[-2] | (core[-1] << 8)
-        calc = calc_crc(resp[0:-4])
+        calc = calc_crc(mv[:-4])
         if recv_crc != calc:
             raise RuntimeError("CRC mismatch")
 
+        # разбираем транзакции до CRC (последние 2 байта core)
+        handlers = _HANDLERS
         i = 0
-        while i < len(core):
+        n = len(core) - 2
+        while i < n:
             trans = core[i]
             ln    = core[i+1]
-            content = core[i+2 : i+2+ln]
-            # DC1: статус
-            if trans == 0x01:
-                st = content[0]
-                mapping = {
-                    0: "NOT_PROGRAMMED", 1: "RESET", 2: "AUTHORIZED",
-                    4: "FILLING",        5: "FILLING_COMPLETE",
-                    6: "MAX_REACHED",    7: "SWITCHED_OFF"
-                }
-                data["pump_status"] = mapping.get(st, f"UNKNOWN({st})")
-            # DC2: vol+amt
-            elif trans == 0x02:
-                vol = bcd_unpack(content[0:4], decimals=settings.VOL_DECIMALS)
-                amt = bcd_unpack(content[4:8], decimals=settings.AMT_DECIMALS)
-                data["current_volume"] = vol
-                data["current_amount"] = amt
-            # DC3: nozzle+price
-            elif trans == 0x03:
-                price = bcd_unpack(content[0:3], decimals=settings.PRICE_DECIMALS)
-                noz   = content[3] & 0x0F
-                outf  = bool((content[3] & 0x10) >> 4)
-                data["current_nozzle"] = noz or None
-                data["nozzle_out"] = outf
-                data["current_price"] = price
-            # DC7: pump parameters (16-ый транзакций — DART full impl.)  
-            elif trans == 0x07:
-                # content: [..., GRADE1, GRADE2, ...] – здесь один бит = существование града
-                # допустим, каждый байт LSB бит0 = 1 → есть nozzle №(idx+1)
-                grades = 0
-                # смещение: первые 1(reserved22)+1+1+1+5 +4+2 = 36 байт, потом 15 байт grades
-                # для простоты: берем последние 15 байт
-                grade_bytes = content[-15:]
-                for idx, b in enumerate(grade_bytes):
-                    if b != 0:
-                        grades |= (1 << idx)
-                data["grades_mask"] = grades
-            # DC9: identity
-            elif trans == 0x09:
-                # 5-байт BCD
-                pid = "".join(f"{b:02X}" for b in content)
-                data["pump_identity"] = pid
+            h = handlers.get(trans)
+            if h is None:
+                logger.debug("Unknown DC trans %02X", trans)
             else:
-                logging.debug(f"Unknown DC trans {trans:02X}")
+                h(data, core[i+2 : i+2+ln])
             i += 2 + ln
         return data
\ No newline at end of file
@@ -0,0 +1,16 @@
+# driver_singleton.py
+"""
+Единственный экземпляр драйвера MKR5 на процесс.
+Создаётся лениво, при первом get_driver(); порт здесь НЕ открывается:
+open()/close() вызываются только в startup/shutdown-событиях FastAPI (main.py).
+"""
+from functools import lru_cache
+
+from driver import MKR5Driver
+import settings
+
+
+@lru_cache(maxsize=1)
+def get_driver() -> MKR5Driver:
+    """Общий драйвер на порту settings.COM_PORT (get_driver.cache_clear() — пересоздать)."""
+    return MKR5Driver(settings.COM_PORT, settings.BAUDRATE, settings.TIMEOUT)
@@ -1,7 +1,7 @@
 # main.py
 from fastapi import FastAPI
 import pump
-import settings
+import bus
 import logging
 
 # Инициализация логирования (запись в файл и консоль, уровень DEBUG)
@@ -19,17 +19,15 @@ app = FastAPI(title="Mekser MKR5 Pump API", description="API для управл
 # Подключение роутеров
 app.include_router(pump.router, prefix="/pumps", tags=["pumps"])
 
-# При старте приложения открываем соединение с COM-портом
-from driver import MKR5Driver
+# Общий драйвер (тот же, что в pump_service); порт открывается при старте приложения
+from driver_singleton import get_driver
 
-driver = MKR5Driver(port=settings.COM_PORT, baudrate=settings.BAUDRATE)
-driver.open()  # установить соединение
-
-# Можно использовать events: startup/shutdown для автоматического управления ресурсами
 @app.on_event("startup")
-def startup_event():
-    driver.open()
+async def startup_event():
+    get_driver().open()
+    bus.start()  # все обращения к шине идут через одну очередь (см. bus.py)
 
 @app.on_event("shutdown")
-def shutdown_event():
-    driver.close()
\ No newline at end of file
+async def shutdown_event():
+    await bus.stop()
+    get_driver().close()
\ No newline at end of file
@@ -1,75 +1,187 @@
 # services/pump_service.py
-from typing import List
-from driver import MKR5Driver
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from driver_singleton import get_driver
 from schemas import PumpStatusResponse, NozzlesStatusResponse
 import settings
 from driver import RETURN_STATUS, RETURN_PUMP_PARAMS
-from utils import bcd_pack
+from utils import bcd_pack3, bcd_pack4
 import logging
+import struct
+import time
 
+logger = logging.getLogger(__name__)
 
-# Предполагаем, что driver открыт и готов к работе (инициализирован в main.py)
-driver = MKR5Driver(settings.COM_PORT, settings.BAUDRATE, settings.TIMEOUT)
-driver.open()
+# Заголовок транзакции уровня-3: (код транзакции, длина данных)
+_TRANS_HDR = struct.Struct("<BB")
+
+# Неизменяемая транзакция CD1 AUTHORIZE (код команды 0x6)
+_AUTHORIZE_TXN = b"\x01\x01\x06"
+# Заголовки CD3 (Preset Volume) и CD4 (Preset Amount): 4 байта BCD
+_PRESET_VOL_HDR = _TRANS_HDR.pack(0x03, 4)
+_PRESET_AMT_HDR = _TRANS_HDR.pack(0x04, 4)
+
+def _mk_packer(pack, scale: int):
+    """Упаковщик величины в BCD (bcd_pack3/bcd_pack4) с зашитым множителем scale (10**decimals)."""
+    def packer(value: float) -> bytes:
+        return pack(int(round(value * scale)))
+    return packer
+
+
+# settings читается один раз, при импорте
+_pack_price = _mk_packer(bcd_pack3, settings.PRICE_SCALE)   # CD5: 3 байта на пистолет
+_pack_vol = _mk_packer(bcd_pack4, settings.VOL_SCALE)       # CD3
+_pack_amt = _mk_packer(bcd_pack4, settings.AMT_SCALE)       # CD4
+
+# драйвер (get_driver()) открывается в startup-событии main.py
+
+# Кэш list_pumps: (найденные pump_id, time.monotonic() момента сканирования)
+_pump_cache = (frozenset(), 0.0)
+
+# Известное состояние колонок: pump_id -> {"nozzles": [...], "prices": {пистолет: цена}, "status": str}
+_pump_state: Dict[int, dict] = {}
+
+# Последний разобранный RETURN_STATUS: pump_id -> (time.monotonic() запроса, parsed).
+# Блокировка не нужна — все вызовы идут по одному через bus.py.
+_status_cache: Dict[int, Tuple[float, dict]] = {}
+
+
+def invalidate(pump_id: int) -> None:
+    """Сбрасывает сохранённое состояние колонки (пистолеты, цены, статус)."""
+    _pump_state.pop(pump_id, None)
+    _status_cache.pop(pump_id, None)
+
+
+def _remember(pump_id: int, parsed: dict) -> dict:
+    """
+    Обновляет _pump_state[pump_id] по разобранному ответу колонки и возвращает его.
+    Переход колонки в NOT_PROGRAMMED (настройки потеряны) сбрасывает кэш.
+    """
+    status = parsed.get("pump_status")
+    state = _pump_state.get(pump_id)
+    if state is not None and status == "NOT_PROGRAMMED" and state.get("status") != status:
+        invalidate(pump_id)
+    state = _pump_state.setdefault(pump_id, {})
+    if status is not None:
+        state["status"] = status
+    nozzle, price = parsed.get("current_nozzle"), parsed.get("current_price")
+    if nozzle and price is not None:
+        state.setdefault("prices", {})[nozzle] = price
+    return state
 
 
 def list_pumps() -> List[int]:
     """
     Сканирует адреса 0..31 (0x50..0x6F).
     Возвращает список pump_id, которые ответили хоть на один запрос RETURN_STATUS.
+    Результат кэшируется на settings.SCAN_TTL сек. При пересканировании
+    следующий запрос уходит, как только дочитан ответ предыдущего адреса
+    или он молчал settings.SCAN_GAP сек, — а не после timeout на каждом
+    «мёртвом» адресе.
     """
-    found = []
-    for pid in range(32):
+    drv = get_driver()
+    global _pump_cache
+    cached, ts = _pump_cache
+    if time.monotonic() - ts < settings.SCAN_TTL:
+        return sorted(cached)
+
+    frames = []
+    complete = True
+    try:
+        for pid in range(32):
+            drv.send_command_nowait(pid, dcc=RETURN_STATUS)
+            # вернётся, когда ответ дочитан целиком или его не было SCAN_GAP
+            frames += drv.poll_responses(settings.SCAN_GAP)
+    except Exception as e:
+        # порт недоступен — отдаём то, что успели собрать, и не кэшируем
+        logger.warning("Bus scan interrupted: %s", e)
+        complete = False
+
+    found = set()
+    for frame in frames:
         try:
-            resp = driver.send_command(pid, dcc=RETURN_STATUS)
-            parsed = driver.parse_response(resp)
-            if "pump_status" in parsed:
-                found.append(pid)
-                logging.debug(f"Pump {pid} found with status {parsed['pump_status']}")
+            parsed = drv.parse_response(frame)
         except Exception:
-            # ничего не делаем, просто пропускаем «мёртвые» адреса
+            # битые/чужие блоки просто пропускаем
             continue
-    return found
+        pid = frame[0] - 0x50
+        if "pump_status" in parsed and 0 <= pid < 32:
+            found.add(pid)
+            logger.debug("Pump %d found with status %s", pid, parsed["pump_status"])
+    if complete:
+        _pump_cache = (frozenset(found), time.monotonic())
+    return sorted(found)
 
 
 def list_nozzles(pump_id: int) -> List[int]:
     """
     Запрашивает у ТРК pump parameters (DC7) и собирает по grades_mask список пистолетов.
     """
-    # Сначала проверим, что колонка действительно отвечает
-    resp0 = driver.send_command(pump_id, dcc=RETURN_STATUS)
-    parsed0 = driver.parse_response(resp0)
-    if "pump_status" not in parsed0:
-        raise RuntimeError(f"Pump {pump_id} не отвечает")
-
-    # Теперь запросим параметры колонки (DC7 → RETURN_PUMP_PARAMS)
-    resp = driver.send_command(pump_id, dcc=RETURN_PUMP_PARAMS)
-    parsed = driver.parse_response(resp)
+    drv = get_driver()
+    # Запрашиваем параметры колонки (DC7 → RETURN_PUMP_PARAMS) сразу, без
+    # отдельной проверки RETURN_STATUS: молчащая колонка даст ошибку и здесь
+    try:
+        parsed = drv.exchange(pump_id, RETURN_PUMP_PARAMS)
+    except Exception as e:
+        raise RuntimeError(f"Pump {pump_id} не отвечает: {e}")
 
     mask = parsed.get("grades_mask", 0)
-    logging.debug(f"Pump {pump_id} grades_mask = {mask:015b}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Pump %d grades_mask = %s", pump_id, format(mask, "015b"))
 
-    # Биты 0–14 маски соответствуют доступности пистолетов №1–15
-    nozzles = [i + 1 for i in range(15) if (mask >> i) & 1]
-    logging.info(f"Pump {pump_id} has nozzles: {nozzles}")
+    # Биты 0–14 маски соответствуют доступности пистолетов №1–15;
+    # обходим только установленные биты (младший бит — m & -m)
+    nozzles = []
+    m = mask
+    while m:
+        lsb = m & -m
+        nozzles.append(lsb.bit_length())  # у степени двойки bit_length = номер бита + 1
+        m ^= lsb
+    logger.info("Pump %d has nozzles: %s", pump_id, nozzles)
+    if "grades_mask" in parsed:
+        _pump_state.setdefault(pump_id, {})["nozzles"] = nozzles
     return nozzles
 
-def get_status(pump_id: int) -> PumpStatusResponse:
+def _fetch_status(pump_id: int) -> dict:
     """
-    Запрос статуса колонки: отправляет команду RETURN_STATUS и ждёт ответа.
-    Возвращает объект PumpStatusResponse с полями pump_id, status, active_nozzle и т.д.
+    Один обмен RETURN_STATUS на колонку за settings.STATUS_TTL сек:
+    get_status и get_nozzles_status, вызванные подряд, используют один ответ.
+    Исключения драйвера пробрасываются как есть.
+    """
+    drv = get_driver()
+    now = time.monotonic()
+    hit = _status_cache.get(pump_id)
+    if hit is not None and now - hit[0] < settings.STATUS_TTL:
+        return hit[1]
+    parsed = drv.exchange(pump_id, RETURN_STATUS)
+    if parsed:
+        _remember(pump_id, parsed)
+        _status_cache[pump_id] = (now, parsed)
+    return parsed
+
+@dataclass(slots=True, frozen=True)
+class _PumpStatusRaw:
+    """Статус колонки для внутренних вызовов — без pydantic-модели."""
+    pump_id: int
+    status: str
+    active_nozzle: Optional[int]
+    volume: Optional[float]
+    amount: Optional[float]
+
+def _get_status_raw(pump_id: int) -> _PumpStatusRaw:
+    """
+    Статус колонки (RETURN_STATUS через _fetch_status) в виде _PumpStatusRaw.
+    RuntimeError — если колонка не ответила или ответ не разобран.
     """
     try:
-        # Просто вызываем send_command с нужным DCC
-        response = driver.send_command(pump_id, dcc=RETURN_STATUS)
+        parsed = _fetch_status(pump_id)
     except Exception as e:
         raise RuntimeError(f"Pump {pump_id} не отвечает на RETURN_STATUS: {e}")
 
-    parsed = driver.parse_response(response)
     if not parsed or "pump_status" not in parsed:
         raise RuntimeError(f"Не удалось распарсить ответ колонки {pump_id}")
 
-    return PumpStatusResponse(
+    return _PumpStatusRaw(
         pump_id=pump_id,
         status=parsed["pump_status"],
         active_nozzle=parsed.get("current_nozzle"),
@@ -77,30 +189,51 @@ def get_status(pump_id: int) -> PumpStatusResponse:
         amount=parsed.get("current_amount")
     )
 
+def get_status(pump_id: int) -> PumpStatusResponse:
+    """
+    Запрос статуса колонки: отправляет команду RETURN_STATUS и ждёт ответа.
+    Возвращает объект PumpStatusResponse с полями pump_id, status, active_nozzle и т.д.
+    """
+    raw = _get_status_raw(pump_id)
+    # pydantic-модель — только на границе HTTP, внутри хватает _PumpStatusRaw
+    return PumpStatusResponse(
+        pump_id=raw.pump_id,
+        status=raw.status,
+        active_nozzle=raw.active_nozzle,
+        volume=raw.volume,
+        amount=raw.amount
+    )
+
 def get_nozzles_status(pump_id: int) -> NozzlesStatusResponse:
     """
     Получение статуса всех пистолетов: фактически также требует запроса Return Status 
     (колонка вернёт информацию о поднятом пистолете и ценах).
     """
-    response = driver.send_command(pump_id, dcc=RETURN_STATUS)  # (можно повторно использовать транзакцию Return Status)
-    parsed = driver.parse_response(response)
+    try:
+        parsed = _fetch_status(pump_id)  # тот же ответ, что у get_status, если он свежий
+    except Exception as e:
+        raise RuntimeError(f"Pump {pump_id} не отвечает на RETURN_STATUS: {e}")
     if not parsed:
         return None
-    # Из разбора возьмём текущий поднятый пистолет и его состояние. 
-    # Для остальных пистолетов считаем, что они не подняты.
-    nozzle_count = 4  # допустим, известно, что у данной колонки 4 пистолета
-    nozzles = []
+    state = _pump_state.setdefault(pump_id, {})
+    # Список пистолетов берём из кэша (один запрос DC7 на колонку),
+    # цены — последние известные: установленные через set_price или
+    # сообщённые колонкой для активного пистолета.
+    nozzle_numbers = state.get("nozzles")
+    if nozzle_numbers is None:
+        nozzle_numbers = list_nozzles(pump_id)
+    prices = state.get("prices", {})
     active_nozzle = parsed.get('current_nozzle')
     nozzle_out = parsed.get('nozzle_out', False)
-    current_price = parsed.get('current_price')
-    for i in range(1, nozzle_count+1):
-        is_lifted = (active_nozzle == i and nozzle_out)
-        price = current_price if active_nozzle == i else None  # цена указывается для активного, для остальных можно взять из настроек
-        nozzles.append({
-            "nozzle": i,
-            "is_lifted": is_lifted,
-            "price": price or 0.0  # здесь можно хранить последнюю известную цену
-        })
+    # Все пистолеты строятся как опущенные, поднятый (он максимум один)
+    # отмечается после цикла — без сравнения на каждой итерации.
+    # Пистолеты передаём dict-ами: обычная валидация pydantic (ядро на Rust)
+    # быстрее, чем model_construct по каждому NozzleStatus.
+    get_price = prices.get
+    nozzles = [{"nozzle": i, "is_lifted": False, "price": get_price(i, 0.0)}
+               for i in nozzle_numbers]
+    if nozzle_out and active_nozzle in nozzle_numbers:
+        nozzles[nozzle_numbers.index(active_nozzle)]["is_lifted"] = True
     return NozzlesStatusResponse(pump_id=pump_id, nozzles=nozzles)
 
 def set_price(pump_id: int, prices: dict) -> bool:
@@ -108,29 +241,26 @@ def set_price(pump_id: int, prices: dict) -> bool:
     Устанавливает цены на колонке. `prices` – словарь {номер_пистолета: цена}.
     Формирует транзакцию Price Update (CD5) и отправляет колонке.
     """
+    drv = get_driver()
     # Формируем транзакцию CD5 (Price update). Код транзакции = 0x05, данные – по 3 байта BCD на каждую цену.
     trans_code = 0x05
     # Нам нужно отправить цены для всех логических пистолетов по порядку от 1 до N.
-    # Определяем N:
-    nozzle_numbers = sorted(prices.keys())
-    N = nozzle_numbers[-1] if nozzle_numbers else 0
-    price_bytes = b''
-    for n in range(1, N+1):
-        price_val = prices.get(n, 0.0)
-        # Конвертируем price_val во внутренний формат: упакуем в 3 байта BCD [oai_citation:20‡file-lfc395pd3vvpi91fm1wkxs](file://file-LFc395PD3vvpi91fm1WKXs#:~:text=PRI%20is%20the%20price%20in,logical%20nozzle%20number%201%2C%20PRI2).
-        price_bcd = bcd_pack(price_val, decimals=settings.PRICE_DECIMALS, length=3)
-        price_bytes += price_bcd
-    length = len(price_bytes)
-    transaction = bytes([trans_code, length]) + price_bytes
-    # Отправляем команду
-    response = driver.send_command(pump_id, transaction)
+    # Определяем N — старший номер пистолета (сортировка не нужна):
+    N = max(prices, default=0)
+    # Конвертируем цены во внутренний формат: по 3 байта BCD на пистолет [oai_citation:20‡file-lfc395pd3vvpi91fm1wkxs](file://file-LFc395PD3vvpi91fm1WKXs#:~:text=PRI%20is%20the%20price%20in,logical%20nozzle%20number%201%2C%20PRI2).
+    pack, get_price = _pack_price, prices.get
+    price_bytes = b"".join([pack(get_price(n, 0.0)) for n in range(1, N+1)])
+    # Отправляем команду: заголовок и цены пишутся в блок драйвера без склейки
+    parsed = drv.exchange_chain(pump_id, (_TRANS_HDR.pack(trans_code, len(price_bytes)), price_bytes))
+    _status_cache.pop(pump_id, None)  # команда меняет состояние колонки
     # Обычно колонка не присылает явного подтверждения на установку цены, 
-    # но может обновить свой статус. Проверим ответ на ошибки:
-    parsed = driver.parse_response(response)
+    # но может обновить свой статус. Проверим ответ на ошибки (разобран выше):
     if 'error' in parsed:
-        logging.error(f"Error in price update response: {parsed['error']}")
+        logger.error("Error in price update response: %s", parsed["error"])
         return False
-    logging.info(f"Price update for pump {pump_id} successful: {prices}")
+    known = _pump_state.setdefault(pump_id, {}).setdefault("prices", {})
+    known.update((n, prices.get(n, 0.0)) for n in range(1, N+1))
+    logger.info("Price update for pump %d successful: %s", pump_id, prices)
     return True
 
 def authorize(pump_id: int, nozzle: int = None):
@@ -138,63 +268,55 @@ def authorize(pump_id: int, nozzle: int = None):
     Разрешает колонке начать выдачу (AUTHORIZE). 
     Если указан конкретный nozzle, сначала отправляется список разрешённых пистолетов.
     """
-    transactions = bytearray()
+    drv = get_driver()
+    # Куски уровня-3 пишутся драйвером прямо в буфер блока, без склейки
+    parts = []
     # Если задан конкретный пистолет, добавляем транзакцию CD2 (Allowed nozzle numbers) [oai_citation:21‡file-lfc395pd3vvpi91fm1wkxs](file://file-LFc395PD3vvpi91fm1WKXs#:~:text=NOZ1%201%20Nozzle%20number)
     if nozzle:
-        trans_code = 0x02
-        allowed_nozzles = [nozzle]
-        data_bytes = bytes(allowed_nozzles)  # список номеров пистолетов
-        length = len(data_bytes)
-        transactions += bytes([trans_code, length]) + data_bytes
+        # CD2, длина 1, номер пистолета
+        parts.append(bytes((0x02, 1, nozzle)))
     # Добавляем транзакцию CD1 с командой AUTHORIZE (код команды 0x6) [oai_citation:22‡file-lfc395pd3vvpi91fm1wkxs](file://file-LFc395PD3vvpi91fm1WKXs#:~:text=)
-    trans_code = 0x01
-    dcc_authorize = 0x06
-    transactions += bytes([trans_code, 1, dcc_authorize])
+    parts.append(_AUTHORIZE_TXN)
     # Отправляем пакет с одной или двумя транзакциями (в зависимости от наличия nozzle)
-    response = driver.send_command(pump_id, transactions)
-    parsed = driver.parse_response(response)
+    parsed = drv.exchange_chain(pump_id, parts)
+    _status_cache.pop(pump_id, None)
     # Проверим, сменился ли статус на AUTHORIZED:
     status = parsed.get('pump_status')
     if status != "AUTHORIZED":
-        logging.warning(f"Pump {pump_id} authorize command sent, but status = {status}")
+        logger.warning("Pump %d authorize command sent, but status = %s", pump_id, status)
     else:
-        logging.debug(f"Pump {pump_id} authorized successfully")
+        logger.debug("Pump %d authorized successfully", pump_id)
     # (Можно вернуть статус или просто логировать)
 
 def preset_and_authorize(pump_id: int, request):
     """
     Устанавливает предустановленный лимит (объём или сумма) и авторизует колонку.
     """
+    drv = get_driver()
     nozzle = request.nozzle
     volume = request.volume
     amount = request.amount
-    transactions = bytearray()
+    parts = []
     # Команда RESET (сброс дисплея) перед выдачей предварительно оплаченной дозы не всегда обязательна, можно выполнить для ясности
     # transactions += bytes([0x01, 1, 0x05])  # CD1: RESET (DCC 0x5)
     # Ограничение по пистолету, если указано
     if nozzle:
-        trans_code = 0x02
-        data_bytes = bytes([nozzle])
-        transactions += bytes([trans_code, len(data_bytes)]) + data_bytes
+        parts.append(bytes((0x02, 1, nozzle)))
     # Транзакция предустановки:
     if volume is not None:
         # Используем Preset Volume (CD3) – код транзакции 0x03, 4 байта BCD объёма [oai_citation:23‡file-lfc395pd3vvpi91fm1wkxs](file://file-LFc395PD3vvpi91fm1WKXs#:~:text=VOL%204%20Volume)
-        trans_code = 0x03
-        vol_bytes = bcd_pack(volume, decimals=settings.VOL_DECIMALS, length=4)
-        transactions += bytes([trans_code, len(vol_bytes)]) + vol_bytes
+        parts.append(_PRESET_VOL_HDR)
+        parts.append(_pack_vol(volume))
     elif amount is not None:
         # Preset Amount (CD4) – код 0x04, 4 байта BCD суммы [oai_citation:24‡file-lfc395pd3vvpi91fm1wkxs](file://file-LFc395PD3vvpi91fm1WKXs#:~:text=AMO%204%20Amount)
-        trans_code = 0x04
-        amt_bytes = bcd_pack(amount, decimals=settings.AMT_DECIMALS, length=4)
-        transactions += bytes([trans_code, len(amt_bytes)]) + amt_bytes
+        parts.append(_PRESET_AMT_HDR)
+        parts.append(_pack_amt(amount))
     # Добавляем команду AUTHORIZE
-    trans_code = 0x01
-    dcc_authorize = 0x06
-    transactions += bytes([trans_code, 1, dcc_authorize])
-    # Отправляем пакет из нескольких транзакций: [Allowed Nozzle?] + [Preset] + [Authorize]
-    response = driver.send_command(pump_id, transactions)
-    parsed = driver.parse_response(response)
+    parts.append(_AUTHORIZE_TXN)
+    # Отправляем цепочку транзакций одним блоком: [Allowed Nozzle?] + [Preset] + [Authorize]
+    parsed = drv.exchange_chain(pump_id, parts)
+    _status_cache.pop(pump_id, None)
     if parsed.get('pump_status') != "AUTHORIZED":
-        logging.error(f"Preset authorization failed, status = {parsed.get('pump_status')}")
+        logger.error("Preset authorization failed, status = %s", parsed.get("pump_status"))
     else:
-        logging.info(f"Pump {pump_id} authorized with preset (volume={volume}, amount={amount})")
\ No newline at end of file
+        logger.info("Pump %d authorized with preset (volume=%s, amount=%s)", pump_id, volume, amount)
\ No newline at end of file
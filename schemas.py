@@ -1,6 +1,6 @@
 # schemas.py
 from pydantic import BaseModel, Field
-from typing import Dict, List, Optional
+from typing import Annotated, Dict, List, Optional
 
 class PumpList(BaseModel):
     pump_ids: List[int]
@@ -25,11 +25,11 @@ class NozzlesStatusResponse(BaseModel):
     nozzles: List[NozzleStatus] = Field(..., description="Список всех пистолетов с их состоянием")
 
 class PriceUpdateRequest(BaseModel):
-    prices: Dict[int, float] = Field(..., description="Новые цены: ключ – номер пистолета, значение – цена")
+    prices: Dict[int, Annotated[float, Field(ge=0)]] = Field(..., description="Новые цены: ключ – номер пистолета, значение – цена")
 
 class PresetRequest(BaseModel):
     nozzle: Optional[int] = Field(None, description="Номер пистолета для заправки (если None – не ограничено)")
-    volume: Optional[float] = Field(None, description="Предустановленный объём (литры)")
-    amount: Optional[float] = Field(None, description="Предустановленная сумма (валюта)")
+    volume: Optional[float] = Field(None, ge=0, description="Предустановленный объём (литры)")
+    amount: Optional[float] = Field(None, ge=0, description="Предустановленная сумма (валюта)")
     # Валидация: хотя бы один из volume/amount должен быть задан
     # ... (можно реализовать метод .validate() или использование Pydantic Validators)
\ No newline at end of file
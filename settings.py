@@ -12,3 +12,20 @@ TIMEOUT    = 0.5              # сек
 PRICE_DECIMALS = 2   # 55.50  =>  "5550"
 VOL_DECIMALS   = 3   #  20.345 => "20345"
 AMT_DECIMALS   = 2   # 100.00  => "10000"
+
+# Множители для перевода величины в целое BCD (считаются один раз, при импорте)
+PRICE_SCALE = 10 ** PRICE_DECIMALS
+VOL_SCALE   = 10 ** VOL_DECIMALS
+AMT_SCALE   = 10 ** AMT_DECIMALS
+
+
+# Сканирование шины (pump_service.list_pumps)
+SCAN_TTL = 5.0    # сек — столько держим найденный список колонок без пересканирования
+# сек — сколько после отправки опроса ждём начала ответа, прежде чем считать
+# адрес пустым. На 9600 бод 8O1 (11 бит на байт) сам опрос (9 байт) идёт
+# ~10 мс, ответ DC1+DC2+DC3 (25 байт) — ~29 мс; начатый ответ дочитывается
+# целиком (poll_responses), и только потом уходит следующий опрос.
+SCAN_GAP = 0.05
+
+# Статус колонки (pump_service._fetch_status)
+STATUS_TTL = 0.1  # сек — повторный запрос статуса в этом окне отдаётся из кэша
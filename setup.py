@@ -0,0 +1,18 @@
+# setup.py
+"""
+Сборка C-расширения _crc16 (CRC-16 для DART-блоков):
+    python setup.py build_ext --inplace
+Без собранного расширения utils.calc_crc работает на чистом Python.
+"""
+import sys
+
+from setuptools import setup, Extension
+
+# MSVC флаги gcc/clang не понимает; -march=native не ставим — .so должен
+# оставаться переносимым между машинами с одной архитектурой
+extra_compile_args = [] if sys.platform == "win32" else ["-O3"]
+
+setup(
+    name="mkr5-pump-api",
+    ext_modules=[Extension("_crc16", ["_crc16.c"], extra_compile_args=extra_compile_args)],
+)
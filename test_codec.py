@@ -0,0 +1,136 @@
+# test_codec.py
+"""
+Регрессионные тесты кодеков уровня кадра: CRC-16, упакованный BCD,
+grades_mask из DC7. Эталоны — прямые (побитовые/строковые) реализации.
+Запуск: python -m unittest -q
+"""
+import random
+import unittest
+
+import driver
+import utils
+from utils import _calc_crc_py, _int_to_bcd, bcd_pack, bcd_pack3, bcd_pack4, bcd_unpack
+
+try:
+    import _crc16
+except ImportError:
+    _crc16 = None
+
+
+def _crc_bitwise(data) -> int:
+    """CRC-CCITT (poly 0x1021, init 0) по биту — исходный вариант calc_crc."""
+    crc = 0x0000
+    for b in data:
+        crc ^= b << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = (crc << 1) ^ 0x1021
+            else:
+                crc <<= 1
+            crc &= 0xFFFF
+    return crc
+
+
+def _bcd_ref(value: int, digit_count: int) -> bytes:
+    """Упакованный BCD через десятичную строку: цифры и есть hex-полубайты."""
+    return bytes.fromhex(f"{value:0{digit_count}d}")
+
+
+def _grades_ref(content) -> int:
+    """Исходный цикл разбора DC7: бит idx = байт idx последних 15 не ноль."""
+    grades = 0
+    for idx, b in enumerate(content[-15:]):
+        if b != 0:
+            grades |= 1 << idx
+    return grades
+
+
+def _random_buffers(rnd, count=2000, max_len=64):
+    # все длины 0..max_len (короткий путь, slice-by-2/8, нечётные хвосты)
+    for i in range(count):
+        yield bytes(rnd.getrandbits(8) for _ in range(i % (max_len + 1)))
+
+
+class CrcTest(unittest.TestCase):
+    def test_check_value(self):
+        # CRC-16/XMODEM от "123456789"
+        self.assertEqual(_calc_crc_py(b"123456789"), 0x31C3)
+        self.assertEqual(utils.calc_crc(b"123456789"), 0x31C3)
+
+    def test_python_matches_bitwise(self):
+        rnd = random.Random(1)
+        for buf in _random_buffers(rnd):
+            self.assertEqual(_calc_crc_py(buf), _crc_bitwise(buf), buf.hex())
+
+    @unittest.skipIf(_crc16 is None, "_crc16 не собран (python setup.py build_ext --inplace)")
+    def test_extension_matches_bitwise(self):
+        rnd = random.Random(2)
+        for buf in _random_buffers(rnd):
+            self.assertEqual(_crc16.calc_crc(buf), _crc_bitwise(buf), buf.hex())
+
+    @unittest.skipIf(_crc16 is None, "_crc16 не собран (python setup.py build_ext --inplace)")
+    def test_extension_buffer_types(self):
+        data = bytes(range(40))
+        expected = _crc_bitwise(data)
+        for obj in (data, bytearray(data), memoryview(data), memoryview(bytearray(data))[:40]):
+            self.assertEqual(_crc16.calc_crc(obj), expected)
+        with self.assertRaises(TypeError):
+            _crc16.calc_crc("not a buffer")
+
+
+class BcdTest(unittest.TestCase):
+    def test_int_to_bcd_matches_reference(self):
+        rnd = random.Random(3)
+        for digits in range(2, 22, 2):
+            top = 10 ** digits - 1
+            for value in [0, 1, 9, 10, 99, top] + [rnd.randint(0, top) for _ in range(500)]:
+                self.assertEqual(_int_to_bcd(value, digits), _bcd_ref(value, digits), (value, digits))
+
+    def test_fixed_width_packers(self):
+        rnd = random.Random(4)
+        for n in [0, 1, 99, 100, 999999] + [rnd.randint(0, 999999) for _ in range(2000)]:
+            self.assertEqual(bcd_pack3(n), _bcd_ref(n, 6), n)
+        for n in [0, 1, 99, 100, 99999999] + [rnd.randint(0, 99999999) for _ in range(2000)]:
+            self.assertEqual(bcd_pack4(n), _bcd_ref(n, 8), n)
+
+    def test_round_trip(self):
+        rnd = random.Random(5)
+        for _ in range(2000):
+            n = rnd.randint(0, 99999999)
+            self.assertEqual(bcd_unpack(bcd_pack4(n), decimals=3), n / 1000)
+            self.assertEqual(bcd_unpack(bcd_pack(n / 100, decimals=2, length=4), decimals=2), n / 100)
+            m = n % 1000000
+            self.assertEqual(bcd_unpack(bcd_pack3(m), decimals=2), m / 100)
+
+    def test_out_of_range(self):
+        for bad in (-1, -5, 1000000):
+            with self.assertRaises(ValueError):
+                bcd_pack3(bad)
+            with self.assertRaises(ValueError):
+                _int_to_bcd(bad, 6)
+        for bad in (-1, 100000000):
+            with self.assertRaises(ValueError):
+                bcd_pack4(bad)
+        with self.assertRaises(ValueError):
+            _int_to_bcd(-1, 20)
+        with self.assertRaises(ValueError):
+            _int_to_bcd(10 ** 20, 20)
+        with self.assertRaises(ValueError):
+            bcd_pack(-0.001, decimals=3, length=4)
+
+
+class GradesMaskTest(unittest.TestCase):
+    def test_all_masks(self):
+        # все 2^15 комбинаций, ненулевые байты — разные значения (не только 1)
+        prefix = bytes(range(1, 37))
+        for mask in range(1 << 15):
+            grades = bytes(((idx * 37 + mask) % 255 + 1) if mask >> idx & 1 else 0 for idx in range(15))
+            content = memoryview(prefix + grades)
+            data = {}
+            driver._parse_dc7(data, content)
+            self.assertEqual(data["grades_mask"], mask)
+            self.assertEqual(data["grades_mask"], _grades_ref(content))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+# test_driver.py
+"""
+Тесты MKR5Driver.poll_responses на поддельном порту поверх os.pipe:
+«колонка» пишет в pipe из отдельного потока с заданными паузами.
+Запуск: python -m unittest -q
+"""
+import fcntl
+import os
+import struct
+import termios
+import threading
+import time
+import unittest
+
+import driver
+from utils import calc_crc
+
+
+def _frame(pump_id: int, body: bytes) -> bytes:
+    block = bytes((0x50 + pump_id, 0x40)) + body
+    crc = calc_crc(block)
+    return block + bytes((crc & 0xFF, crc >> 8, 0x03, 0xFA))
+
+
+class _PipePort:
+    """Минимум pyserial.Serial, который использует poll_responses: fd, in_waiting, read."""
+
+    def __init__(self):
+        self.fd, self._w = os.pipe()
+        self.is_open = True
+        self._stop = threading.Event()
+        self._threads = []
+
+    @property
+    def in_waiting(self) -> int:
+        return struct.unpack("i", fcntl.ioctl(self.fd, termios.FIONREAD, b"\0" * 4))[0]
+
+    def read(self, n: int) -> bytes:
+        return os.read(self.fd, n)
+
+    def feed(self, chunks, delay: float = 0.0) -> None:
+        """Через delay сек пишет chunks: [(байты, пауза после), ...]."""
+        def run():
+            if self._stop.wait(delay):
+                return
+            for data, pause in chunks:
+                os.write(self._w, data)
+                if self._stop.wait(pause):
+                    return
+        self._start(run)
+
+    def babble(self, data: bytes, period: float) -> None:
+        """Пишет data каждые period сек, пока порт не закрыт (шум на линии)."""
+        def run():
+            while not self._stop.wait(period):
+                os.write(self._w, data)
+        self._start(run)
+
+    def _start(self, fn) -> None:
+        t = threading.Thread(target=fn, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def close(self) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+        os.close(self.fd)
+        os.close(self._w)
+
+
+class PollResponsesTest(unittest.TestCase):
+    GAP = 0.05
+
+    def setUp(self):
+        self.drv = driver.MKR5Driver("pipe", timeout=0.1)
+        self.port = self.drv.ser = _PipePort()
+
+    def tearDown(self):
+        self.port.close()
+
+    def _poll(self):
+        t0 = time.monotonic()
+        frames = self.drv.poll_responses(self.GAP)
+        return frames, time.monotonic() - t0
+
+    def test_silent_address(self):
+        frames, took = self._poll()
+        self.assertEqual(frames, [])
+        self.assertLess(took, self.GAP + 0.05)
+
+    def test_slow_reply_is_read_to_the_end(self):
+        # ответ начинается через 30 мс и идёт 40 мс — дольше SCAN_GAP
+        f = _frame(2, b"\x01\x01\x01")
+        self.port.feed([(f[:3], 0.02), (f[3:6], 0.02), (f[6:], 0)], delay=0.03)
+        frames, took = self._poll()
+        self.assertEqual(frames, [f])
+        self.assertGreaterEqual(took, 0.07)
+        self.assertEqual(self.drv._rx_buf, b"")
+
+    def test_returns_right_after_frame(self):
+        f = _frame(1, b"\x01\x01\x01")
+        self.port.feed([(f, 0)], delay=0.01)
+        frames, took = self._poll()
+        self.assertEqual(frames, [f])
+        self.assertLess(took, self.GAP)
+
+    def test_truncated_reply_is_dropped(self):
+        self.port.feed([(b"\x54\x40\x01", 0)], delay=0.01)
+        frames, took = self._poll()
+        self.assertEqual(frames, [])
+        self.assertEqual(self.drv._rx_buf, b"")
+
+    def test_noise_without_etx_raises(self):
+        # плавающая пара: 16 байт мусора каждые 5 мс, ETX/SF не встречается
+        self.port.babble(b"\x55" * 16, 0.005)
+        t0 = time.monotonic()
+        with self.assertRaises(RuntimeError):
+            self.drv.poll_responses(self.GAP)
+        self.assertLess(time.monotonic() - t0, self.GAP + self.drv.timeout + 0.05)
+        self.assertLessEqual(len(self.drv._rx_buf), driver.MAX_FRAME)
+
+    def test_babbling_slave_is_bounded(self):
+        # «болтливый» slave: короткие блоки без пауз — линия не замолкает
+        self.port.babble(b"\x55\x40\x03\xFA", 0.005)
+        frames, took = self._poll()
+        self.assertTrue(frames)
+        self.assertLess(took, self.GAP + self.drv.timeout + 0.05)
+        self.assertLessEqual(len(self.drv._rx_buf), driver.MAX_FRAME)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,27 +3,89 @@
 Вспомогательные функции: CRC-16-CCITT, упаковка/распаковка BCD.
 """
 
+def _make_crc_table(poly: int = 0x1021) -> tuple:
+    """Строит 256-элементную таблицу CRC-CCITT (MSB-first) для calc_crc."""
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = (crc << 1) ^ poly
+            else:
+                crc <<= 1
+            crc &= 0xFFFF
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC_TABLE = _make_crc_table()
+# slice-by-2: вклад байта, за которым следует ещё один (нулевой) байт
+_CRC_TABLE2 = tuple(((c << 8) & 0xFFFF) ^ _CRC_TABLE[c >> 8] for c in _CRC_TABLE)
+
+
 def calc_crc(data: bytes) -> int:
     """
     Вычисляет 16-битный CRC-CCITT (poly 0x1021, init 0x0000).
+    Табличный вариант: один поиск в _CRC_TABLE на байт вместо 8 сдвигов,
+    для блоков от 16 байт — по два байта за шаг.
     Возвращает целое (0-0xFFFF).
     """
     crc = 0x0000
+    t = _CRC_TABLE
+    if len(data) >= 16:
+        t2 = _CRC_TABLE2
+        it = iter(data)
+        for a, b in zip(it, it):
+            crc = t2[(crc >> 8) ^ a] ^ t[(crc & 0xFF) ^ b]
+        if len(data) & 1:
+            crc = ((crc << 8) & 0xFF00) ^ t[(crc >> 8) ^ data[-1]]
+        return crc
     for b in data:
-        crc ^= b << 8
-        for _ in range(8):
-            if crc & 0x8000:
-                crc = (crc << 1) ^ 0x1021
-            else:
-                crc <<= 1
-            crc &= 0xFFFF
+        crc = ((crc << 8) & 0xFF00) ^ t[(crc >> 8) ^ b]
     return crc
 
 
+_calc_crc_py = calc_crc  # чистый Python-вариант — для сверки с _crc16 в тестах
+
+try:
+    # C-расширение (см. _crc16.c, setup.py) — тот же CRC без цикла на Python
+    from _crc16 import calc_crc
+except ImportError:
+    pass
+
+
+# Маски полос для SWAR-упаковки (см. _int_to_bcd)
+_LANE64_Q = (0x3FFF << 64) | 0x3FFF
+_LANE32_Q = 0x0000007F_0000007F_0000007F_0000007F
+_LANE16_Q = 0x000F000F_000F000F_000F000F_000F000F
+
+
 def _int_to_bcd(value: int, digit_count: int) -> bytes:
-    """Преобразует целое value в BCD длиной digit_count цифр."""
-    s = f"{value:0{digit_count}d}"
-    return bytes(int(s[i : i + 2], 10) for i in range(0, digit_count, 2))
+    """
+    Преобразует целое value в упакованный BCD длиной digit_count цифр
+    (две цифры на байт, старшая — в верхнем полубайте).
+    До 16 цифр считается SWAR-ом: все разряды делятся параллельно
+    в «полосах» одного целого, деление — умножением на обратное.
+    ValueError — если value не помещается в digit_count цифр (или отрицательно).
+    """
+    n = digit_count // 2
+    if not 0 <= value < 10 ** (2 * n):
+        raise ValueError(f"BCD: {value} вне диапазона 0..{10 ** (2 * n) - 1}")
+    if n > 8:
+        # длинные значения — по паре цифр за шаг, младшие байты справа
+        out = bytearray(n)
+        for i in range(n):
+            value, two = divmod(value, 100)
+            out[~i] = ((two // 10) << 4) | (two % 10)
+        return bytes(out)
+    hi, lo = divmod(value, 100000000)
+    x = (hi << 64) | lo                         # 2 полосы по 64 бита: < 10^8
+    q = ((x * 0xD1B71759) >> 45) & _LANE64_Q    # // 10^4
+    x = (q << 32) | (x - q * 10000)             # 4 полосы по 32 бита: < 10^4
+    q = ((x * 5243) >> 19) & _LANE32_Q          # // 100
+    x = (q << 16) | (x - q * 100)               # 8 полос по 16 бит: < 100
+    x += (((x * 205) >> 11) & _LANE16_Q) * 6    # 0..99 -> 0x00..0x99
+    return x.to_bytes(16, "big")[17 - 2 * n :: 2]
 
 
 def bcd_pack(number: float, *, decimals: int, length: int) -> bytes:
@@ -36,11 +98,44 @@ def bcd_pack(number: float, *, decimals: int, length: int) -> bytes:
     return _int_to_bcd(scaled, digit_count)
 
 
+# Значение (0..99) каждого байта упакованного BCD и степени 10 для decimals
+_BCD_BYTE = tuple(((b >> 4) & 0xF) * 10 + (b & 0xF) for b in range(256))
+_POW10 = tuple(10 ** i for i in range(17))
+
+# Байт упакованного BCD для каждой пары цифр 00..99
+_BCD_PAIR = bytes(((p // 10) << 4) | (p % 10) for p in range(100))
+
+
+def bcd_pack3(n: int) -> bytes:
+    """
+    bcd_pack для 3 байт (цены): `n` — уже масштабированное целое 0..999999,
+    например int(round(price * 10**PRICE_DECIMALS)).
+    ValueError — если n вне диапазона.
+    """
+    if not 0 <= n <= 999999:
+        raise ValueError(f"BCD: {n} вне диапазона 0..999999")
+    e = _BCD_PAIR
+    return bytes((e[n // 10000], e[n // 100 % 100], e[n % 100]))
+
+
+def bcd_pack4(n: int) -> bytes:
+    """
+    bcd_pack для 4 байт (объём, сумма): `n` — масштабированное целое 0..99999999.
+    ValueError — если n вне диапазона.
+    """
+    if not 0 <= n <= 99999999:
+        raise ValueError(f"BCD: {n} вне диапазона 0..99999999")
+    e = _BCD_PAIR
+    return bytes((e[n // 1000000], e[n // 10000 % 100], e[n // 100 % 100], e[n % 100]))
+
+
 def bcd_unpack(bcd: bytes, *, decimals: int) -> float:
     """
     Распаковывает BCD-последовательность `bcd` обратно в float
     с учётом `decimals` знаков после запятой.
     """
-    digits = "".join(f"{byte:02d}" for byte in bcd)
-    int_val = int(digits)
-    return int_val / (10 ** decimals)
+    v = 0
+    t = _BCD_BYTE
+    for b in bcd:
+        v = v * 100 + t[b]
+    return v / _POW10[decimals]